@@ -5,12 +5,23 @@ from .peloton import NotLoaded
 from .peloton import PelotonException
 from .peloton import PelotonAPI
 from .peloton import PelotonUser
+from .peloton import PelotonUserOverview
 from .peloton import PelotonWorkout
 from .peloton import PelotonRide
 from .peloton import PelotonMetric
 from .peloton import PelotonInstructor
 from .peloton import PelotonWorkoutSegment
 from .peloton import PelotonWorkoutFactory
+from .peloton import PelotonUserFactory
+
+from .dataframe import workouts_to_dataframe
+from .dataframe import workouts_to_arrow
+from .dataframe import workouts_to_csv
+from .dataframe import metrics_to_dataframe
+from .dataframe import metrics_to_arrow
+
+from .backfill import BackfillJob
+from .backfill import BackfillProgress
 
 _ALL_ = [
     "NotLoaded",
@@ -18,11 +29,22 @@ _ALL_ = [
     "PelotonAPI",
 
     "PelotonUser",
+    "PelotonUserOverview",
     "PelotonWorkout",
     "PelotonRide",
     "PelotonMetric",
     "PelotonInstructor",
     "PelotonWorkoutSegment",
 
-    "PelotonWorkoutFactory"
+    "PelotonWorkoutFactory",
+    "PelotonUserFactory",
+
+    "workouts_to_dataframe",
+    "workouts_to_arrow",
+    "workouts_to_csv",
+    "metrics_to_dataframe",
+    "metrics_to_arrow",
+
+    "BackfillJob",
+    "BackfillProgress"
 ]
\ No newline at end of file
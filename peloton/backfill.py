@@ -0,0 +1,567 @@
+#! /usr/bin/env python3.6
+# -*- coding: latin-1 -*-
+
+""" Resumable, checkpointed backfill of a user's workout history
+
+The work is split into shards (one per page of the workout list, and one
+per `shard_size` workout ids for performance graphs) that are run across
+worker threads or processes. Raw responses are written to disk as each
+shard completes, and a checkpoint recording finished shards is updated
+atomically after every shard, so a crash (or a call to stop()) loses at
+most the shards that were in flight.
+
+Workouts are listed newest first, so every new workout pushes the rest
+further down the list. Fetched pages are therefore tracked by position
+counted from the *oldest* workout (the list total minus the offset),
+which stays put as workouts are added. Each run re-reads page 0 and
+fetches whichever pages aren't yet covered, which both resumes an
+interrupted backfill and picks up workouts logged since the last one.
+Metrics are kept per resolution, so changing `every_n` just fetches the
+new resolution alongside any others already stored.
+
+On-disk layout of `path`:
+
+    checkpoint.json         list total and completed shards
+    pages/<total>-<offset>-<limit>.json
+                            raw /api/user/<id>/workouts responses
+    metrics/<every_n>/<id>.json
+                            raw /api/workout/<id>/performance_graph responses
+"""
+
+import os
+import json
+import time
+import signal
+import threading
+
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import wait
+
+from .peloton import get_logger
+from .peloton import PelotonException
+from .peloton import PelotonAPI
+from .peloton import PelotonWorkout
+from .peloton import PelotonWorkoutMetrics
+from .peloton import PelotonWorkoutFactory
+from .peloton import PelotonWorkoutMetricsFactory
+
+_CHECKPOINT_VERSION = 1
+
+# How many times we'll re-read page 0 and fill in gaps before giving up
+# on a workout list that keeps changing underneath us
+_MAX_PAGE_PASSES = 3
+
+
+def _write_json(path, data):
+    """ Durably write `data` to `path`, such that readers only ever see
+        the old or the new contents
+    """
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+# Process that owns the API sessions held on our factory classes
+_session_pid = os.getpid()
+
+
+def _reset_worker_session():
+    """ Drop any session a worker process inherited from its parent (via
+        fork), so each process logs in with its own connection rather
+        than sharing the parent's socket
+    """
+
+    global _session_pid
+    if _session_pid == os.getpid():
+        return
+
+    for api in [PelotonAPI, PelotonWorkoutFactory,
+                PelotonWorkoutMetricsFactory]:
+        api.peloton_session = None
+        api.user_id = None
+
+    _session_pid = os.getpid()
+
+
+@contextmanager
+def _sigint_blocked():
+    """ Hold off SIGINT in this thread. Worker processes started (by
+        ProcessPoolExecutor, as work is submitted) meanwhile inherit the
+        block, so ^C at a terminal is handled by us alone rather than by
+        every worker too. Any SIGINT we get is delivered on the way out
+    """
+
+    # Not available on Windows
+    if not hasattr(signal, 'pthread_sigmask'):
+        yield
+        return
+
+    mask = signal.pthread_sigmask(signal.SIG_BLOCK, [signal.SIGINT])
+    try:
+        yield
+    finally:
+        signal.pthread_sigmask(signal.SIG_SETMASK, mask)
+
+
+def _page_path(path, entry):
+    return os.path.join(
+        path, 'pages', '{total}-{offset}-{limit}.json'.format(**entry))
+
+
+def _page_span(entry):
+    """ Returns the [start, end) positions, counted from the oldest
+        workout, covered by a fetched page
+    """
+    end = entry['total'] - entry['offset']
+    return end - entry['count'], end
+
+
+def _covered(spans, start, end):
+    """ Whether the [start, end) range of positions is entirely covered
+        by `spans`
+    """
+    position = start
+    for span_start, span_end in sorted(spans):
+        if position >= end or span_start > position:
+            break
+        position = max(position, span_end)
+
+    return position >= end
+
+
+def _fetch_page(path, page, results_per_page):
+    """ Worker: fetch and store one page of workouts
+
+    Returns a dict describing the stored page
+    """
+
+    _reset_worker_session()
+
+    res = PelotonWorkoutFactory._list_page(page, results_per_page)
+    entry = {
+        'total': res['total'],
+        'offset': page * results_per_page,
+        'limit': results_per_page,
+        'count': len(res['data']),
+    }
+    _write_json(_page_path(path, entry), res)
+    return entry
+
+
+def _metrics_path(path, every_n, workout_id=None):
+    ret = os.path.join(path, 'metrics', str(every_n))
+    if workout_id is not None:
+        ret = os.path.join(ret, '{}.json'.format(workout_id))
+    return ret
+
+
+def _fetch_metrics(path, workout_ids, every_n):
+    """ Worker: fetch and store the performance graph of each workout
+    """
+
+    _reset_worker_session()
+
+    for workout_id in workout_ids:
+        res = PelotonWorkoutMetricsFactory._get_raw(workout_id, every_n)
+        _write_json(_metrics_path(path, every_n, workout_id), res)
+
+
+class BackfillProgress:
+    """ Snapshot of how far along a phase of a BackfillJob is
+    """
+
+    def __init__(self, phase, done, total, elapsed):
+
+        self.phase = phase
+        self.done = done
+        self.total = total
+
+        # Seconds spent on this phase, in this run
+        self.elapsed = elapsed
+
+        # Shards completed in this run, used to estimate our rate
+        self.completed_this_run = 0
+
+    @property
+    def eta(self):
+        """ Estimated seconds remaining in this phase, or None if we
+            don't have enough information yet
+        """
+        if not self.completed_this_run:
+            return None
+
+        rate = self.elapsed / self.completed_this_run
+        return rate * (self.total - self.done)
+
+    def __str__(self):
+        eta = self.eta
+        return "{}: {}/{} shards{}".format(
+            self.phase, self.done, self.total,
+            "" if eta is None else ", ~{:.0f}s remaining".format(eta))
+
+
+class BackfillJob:
+    """ Fetches every workout (and optionally its metrics) for the
+        authenticated user, checkpointing to `path` as it goes
+
+    Running the same job again with the same `path` resumes from the
+    last checkpoint
+    """
+
+    def __init__(self, path, results_per_page=10, every_n=1,
+                 shard_size=25, workers=4, use_processes=False,
+                 fetch_metrics=True, workout_filter=None, progress=None):
+        """
+        Args:
+            path: directory that holds our checkpoint and fetched data
+            results_per_page: workouts per page of the workout list
+            every_n: resolution (in seconds) of performance graphs
+            shard_size: number of workouts per metrics shard
+            workers: number of worker threads (or processes)
+            use_processes: use a process pool instead of threads
+            fetch_metrics: whether or not to fetch performance graphs
+            workout_filter: optional callable, given a raw workout dict,
+                            returning whether to fetch its metrics
+            progress: optional callable, invoked with a BackfillProgress
+                      after every shard
+        """
+
+        self.path = path
+        self.results_per_page = results_per_page
+        self.every_n = every_n
+        self.shard_size = shard_size
+        self.workers = workers
+        self.use_processes = use_processes
+        self.fetch_metrics = fetch_metrics
+        self.workout_filter = workout_filter
+        self.progress = progress
+
+        # Number of API requests made by this instance, in total and
+        # per phase
+        self.requests_made = 0
+        self.requests = {}
+
+        # Seconds spent in each phase by this instance
+        self.timings = {}
+
+        self._stop = threading.Event()
+        self._checkpoint = None
+
+    @property
+    def _checkpoint_path(self):
+        return os.path.join(self.path, 'checkpoint.json')
+
+    def _load_checkpoint(self):
+        """ Load our checkpoint from disk, or start a fresh one
+        """
+
+        if not os.path.exists(self._checkpoint_path):
+            checkpoint = {
+                'version': _CHECKPOINT_VERSION,
+                'total': None,
+                'pages': [],
+
+                # Workout ids we have metrics for, keyed by every_n
+                'metrics_done': {},
+            }
+            _write_json(self._checkpoint_path, checkpoint)
+            return checkpoint
+
+        checkpoint = _read_json(self._checkpoint_path)
+        if checkpoint.get('version') != _CHECKPOINT_VERSION:
+            raise PelotonException(
+                "Unsupported checkpoint version in {}, remove it to "
+                "start the backfill over".format(self.path))
+
+        return checkpoint
+
+    def _save_checkpoint(self):
+        _write_json(self._checkpoint_path, self._checkpoint)
+
+    def stop(self):
+        """ Ask a running job to stop once its in-flight shards finish.
+            Safe to call from another thread or a signal handler
+        """
+        self._stop.set()
+
+    @property
+    def stopped(self):
+        return self._stop.is_set()
+
+    def run(self):
+        """ Run (or resume) the backfill
+
+        Returns True if the backfill is complete, or False if it was
+        stopped before finishing
+        """
+
+        # Only created once we're going to write, so that reading a
+        # cache (see workouts()) never modifies it
+        os.makedirs(os.path.join(self.path, 'pages'), exist_ok=True)
+        os.makedirs(_metrics_path(self.path, self.every_n), exist_ok=True)
+
+        self._stop.clear()
+        self._checkpoint = self._load_checkpoint()
+
+        # Log in up front, rather than having every worker thread race
+        # to do so. Worker processes each log in on their own (see
+        # _reset_worker_session)
+        if not self.use_processes:
+            for factory in [PelotonWorkoutFactory,
+                            PelotonWorkoutMetricsFactory]:
+                if factory.peloton_session is None:
+                    factory._create_api_session()
+
+        # Fill in whatever pages we're missing, then check page 0 again
+        # in case workouts were added while we were paging
+        for _ in range(_MAX_PAGE_PASSES):
+            pages = self._missing_pages(self._refresh())
+            if not pages:
+                break
+
+            self._run_phase(
+                'pages', [[page] for page in pages], len(pages))
+            if self.stopped:
+                return False
+
+        else:
+            get_logger().warning(
+                "Workout list kept changing while paging, run the "
+                "backfill again to pick up the rest")
+
+        if not self.fetch_metrics:
+            return True
+
+        workout_ids = []
+        for workout in self._raw_workouts():
+            if self.workout_filter is None or self.workout_filter(workout):
+                workout_ids.append(workout['id'])
+
+        metrics_done = set(
+            self._checkpoint['metrics_done'].get(str(self.every_n), []))
+        remaining = [w for w in workout_ids if w not in metrics_done]
+
+        shards = [remaining[i:i + self.shard_size]
+                  for i in range(0, len(remaining), self.shard_size)]
+        finished = len(workout_ids) - len(remaining)
+        total = len(shards) + \
+            (finished + self.shard_size - 1) // self.shard_size
+        self._run_phase('metrics', shards, total)
+
+        return not self.stopped
+
+    def _refresh(self):
+        """ Fetch page 0, which tells us how many workouts there are now,
+            and record it. Returns the current workout total
+        """
+
+        started = time.monotonic()
+        entry = _fetch_page(self.path, 0, self.results_per_page)
+        self.requests_made += 1
+        self.requests['pages'] = self.requests.get('pages', 0) + 1
+
+        # Positions only hold still while workouts are being added. If
+        # the list shrank, something was deleted and our pages can't be
+        # trusted, so start them over (metrics are keyed by id, and kept)
+        pages = self._checkpoint['pages']
+        if pages and entry['total'] < max(_page_span(e)[1] for e in pages):
+            get_logger().warning(
+                "Workouts were deleted since the last backfill, "
+                "re-fetching the workout list")
+            del pages[:]
+
+        if entry not in pages:
+            pages.append(entry)
+
+        self._checkpoint['total'] = entry['total']
+        self._save_checkpoint()
+
+        self.timings['pages'] = self.timings.get('pages', 0) + \
+            time.monotonic() - started
+        return entry['total']
+
+    def _missing_pages(self, total):
+        """ Returns the page numbers (for a list of `total` workouts) that
+            hold workouts we haven't fetched
+        """
+
+        spans = [_page_span(entry) for entry in self._checkpoint['pages']]
+
+        ret = []
+        page = 0
+        while page * self.results_per_page < total:
+            end = total - page * self.results_per_page
+            if not _covered(
+                    spans, max(0, end - self.results_per_page), end):
+                ret.append(page)
+            page += 1
+
+        return ret
+
+    def _submit(self, executor, phase, shard):
+        if phase == 'pages':
+            return executor.submit(
+                _fetch_page, self.path, shard[0], self.results_per_page)
+
+        return executor.submit(
+            _fetch_metrics, self.path, shard, self.every_n)
+
+    def _record(self, phase, shard, result):
+        """ Mark a shard as done in our checkpoint
+        """
+
+        if phase == 'pages':
+            if result not in self._checkpoint['pages']:
+                self._checkpoint['pages'].append(result)
+        else:
+            self._checkpoint['metrics_done'].setdefault(
+                str(self.every_n), []).extend(shard)
+
+        self.requests_made += len(shard)
+        self.requests[phase] = self.requests.get(phase, 0) + len(shard)
+        self._save_checkpoint()
+
+    def _run_phase(self, phase, shards, total):
+        """ Run `shards` for `phase` across our workers, checkpointing
+            after each one
+        """
+
+        started = time.monotonic()
+        progress = BackfillProgress(
+            phase, total - len(shards), total, 0)
+
+        if self.use_processes:
+            executor = ProcessPoolExecutor(max_workers=self.workers)
+        else:
+            executor = ThreadPoolExecutor(max_workers=self.workers)
+
+        pending = list(reversed(shards))
+        running = {}
+
+        try:
+            while pending or running:
+
+                # Keep every worker busy, unless we've been asked to stop
+                while pending and len(running) < self.workers \
+                        and not self.stopped:
+                    shard = pending.pop()
+                    with _sigint_blocked():
+                        future = self._submit(executor, phase, shard)
+                    running[future] = shard
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    shard = running.pop(future)
+
+                    # Raises if the shard failed. Completed shards are
+                    # already checkpointed, so nothing is lost
+                    self._record(phase, shard, future.result())
+
+                    progress.done += 1
+                    progress.completed_this_run += 1
+                    progress.elapsed = time.monotonic() - started
+                    if self.progress is not None:
+                        self.progress(progress)
+
+        except Exception:
+            # A shard failed. Let in-flight shards finish (and checkpoint
+            # any that succeed) before we bail out
+            self._stop.set()
+            for future in running:
+                try:
+                    result = future.result()
+                except Exception:
+                    continue
+                self._record(phase, running[future], result)
+
+            executor.shutdown()
+            raise
+
+        except BaseException:
+            # KeyboardInterrupt and friends: bail out now, without waiting
+            # on in-flight shards. They'll be re-run next time
+            self._stop.set()
+            for future in running:
+                future.cancel()
+
+            executor.shutdown(wait=False)
+            raise
+
+        else:
+            executor.shutdown()
+
+        finally:
+            self.timings[phase] = self.timings.get(phase, 0) + \
+                time.monotonic() - started
+
+        if self.stopped:
+            get_logger().warning(
+                "Backfill stopped during {} with {}/{} shards done".format(
+                    phase, progress.done, progress.total))
+
+    def _raw_workouts(self):
+        """ Yield each raw workout dict we've fetched, newest first
+
+        Pages fetched at different times overlap, so the same workout
+        can show up more than once; we only yield it once
+        """
+
+        checkpoint = self._checkpoint or _read_json(self._checkpoint_path)
+
+        # Maps workout id to (position from oldest, workout)
+        workouts = {}
+        for entry in checkpoint['pages']:
+            res = _read_json(_page_path(self.path, entry))
+            end = _page_span(entry)[1]
+            for i, workout in enumerate(res['data']):
+                workouts[workout['id']] = (end - 1 - i, workout)
+
+        for _, workout in sorted(
+                workouts.values(), key=lambda w: w[0], reverse=True):
+            yield workout
+
+    def workouts(self, every_n=None):
+        """ Yield a PelotonWorkout for each workout we've fetched, with
+            metrics attached when we have them
+
+        Args:
+            every_n: resolution of metrics to attach. Defaults to the
+                     finest resolution stored for each workout
+        """
+
+        metrics_dir = os.path.join(self.path, 'metrics')
+        if every_n is not None:
+            resolutions = [every_n]
+        elif os.path.isdir(metrics_dir):
+            resolutions = sorted(
+                int(r) for r in os.listdir(metrics_dir) if r.isdigit())
+        else:
+            resolutions = []
+
+        for workout in self._raw_workouts():
+            for resolution in resolutions:
+                metrics_path = _metrics_path(
+                    self.path, resolution, workout['id'])
+                if os.path.exists(metrics_path):
+                    workout = dict(workout)
+                    workout['metrics'] = PelotonWorkoutMetrics(
+                        **_read_json(metrics_path))
+                    break
+
+            yield PelotonWorkout(**workout)
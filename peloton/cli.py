@@ -0,0 +1,368 @@
+#! /usr/bin/env python3.6
+# -*- coding: latin-1 -*-
+
+""" The `peloton` command line tool
+
+    peloton sync    fetch new workouts (resuming any interrupted sync) to a cache
+    peloton export  write cached workouts out as json, ndjson, csv or parquet
+    peloton stats   summarise cached workouts (or the account, via --remote)
+
+Every subcommand prints per-phase timings and request counts to stderr
+when it finishes
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+
+from .peloton import PelotonAPI
+from .peloton import PelotonException
+from .peloton import PelotonUser
+from .backfill import BackfillJob
+from .dataframe import workouts_to_arrow
+from .dataframe import workouts_to_csv
+
+_FORMATS = ['json', 'ndjson', 'csv', 'parquet']
+
+
+def _default_cache_dir():
+    return os.environ.get(
+        "PELOTON_CACHE", os.path.expanduser("~/.cache/peloton"))
+
+
+def _parse_date(value):
+    """ argparse type for YYYY-MM-DD dates, interpreted as UTC
+    """
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').replace(
+            tzinfo=timezone.utc)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "expected a date as YYYY-MM-DD, got {!r}".format(value))
+
+
+class _Timer:
+    """ Tracks how long each phase of a command took, and how many API
+        requests it made
+    """
+
+    def __init__(self):
+        self.phases = []
+
+    def phase(self, name, seconds, requests=0):
+        self.phases.append((name, seconds, requests))
+
+    def report(self, stream=sys.stderr):
+        for name, seconds, requests in self.phases:
+            print("{:<10} {:>9.2f}s {:>7} requests".format(
+                name, seconds, requests), file=stream)
+
+        print("{:<10} {:>9.2f}s {:>7} requests".format(
+            'total', sum(p[1] for p in self.phases),
+            sum(p[2] for p in self.phases)), file=stream)
+
+
+def _in_range(args):
+    """ Returns a filter for raw workout dicts honouring --since/--until
+    """
+
+    since = args.since.timestamp() if args.since else None
+
+    # --until is inclusive of the whole day
+    until = (args.until + timedelta(days=1)).timestamp() \
+        if args.until else None
+
+    def _filter(workout):
+        start_time = workout.get('start_time') or 0
+        if since is not None and start_time < since:
+            return False
+        if until is not None and start_time >= until:
+            return False
+        return True
+
+    return _filter
+
+
+def _cached_workouts(args, every_n=None):
+    """ Yield cached PelotonWorkout instances within our date range, with
+        metrics at `every_n` (or the finest resolution cached) attached
+    """
+
+    if not os.path.exists(os.path.join(args.cache_dir, 'checkpoint.json')):
+        raise PelotonException(
+            "Nothing cached in {}, run `peloton sync` first".format(
+                args.cache_dir))
+
+    in_range = _in_range(args)
+    for workout in BackfillJob(args.cache_dir).workouts(every_n):
+        if in_range({'start_time': workout.start_time.timestamp()}):
+            yield workout
+
+
+def _record_sync(job, timer):
+    """ Record the timings and request counts of each phase of a sync
+    """
+
+    # BackfillJob counts requests per shard, which (unlike our
+    # per-process counter) is accurate across worker processes
+    for name, seconds in job.timings.items():
+        timer.phase(name, seconds, job.requests.get(name, 0))
+
+
+def sync(args, timer):
+
+    job = BackfillJob(
+        args.cache_dir,
+        results_per_page=args.page_size,
+        every_n=args.every_n,
+        shard_size=args.shard_size,
+        workers=args.jobs,
+        use_processes=args.processes,
+        fetch_metrics=not args.no_metrics,
+        workout_filter=_in_range(args),
+        progress=None if args.quiet else
+        lambda progress: print(progress, file=sys.stderr))
+
+    # First ^C stops gracefully (checkpointing in-flight shards), a
+    # second one gives up immediately
+    def _stop(signum, frame):
+        print("Stopping after in-flight shards finish "
+              "(^C again to abort)", file=sys.stderr)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        job.stop()
+
+    signal.signal(signal.SIGINT, _stop)
+
+    try:
+        complete = job.run()
+
+    except KeyboardInterrupt:
+        _record_sync(job, timer)
+        if not args.quiet:
+            timer.report()
+        print("Sync aborted, run it again to resume", file=sys.stderr)
+
+        # Worker threads/processes still hold in-flight requests, and the
+        # interpreter would wait for them on the way out. Everything
+        # finished is already checkpointed, so just leave
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(130)
+
+    finally:
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    _record_sync(job, timer)
+    if not complete:
+        print("Sync stopped early, run it again to resume", file=sys.stderr)
+        return 1
+
+    return 0
+
+
+def export(args, timer):
+
+    started = time.monotonic()
+    workouts = list(_cached_workouts(args, args.every_n))
+    timer.phase('load', time.monotonic() - started)
+
+    started = time.monotonic()
+    if args.format == 'parquet':
+        if args.output is None:
+            raise PelotonException("parquet export requires --output")
+
+        try:
+            import pyarrow.parquet
+        except ImportError:
+            raise PelotonException(
+                "pyarrow is required for parquet export, "
+                "install it with `pip install pyarrow`")
+
+        pyarrow.parquet.write_table(workouts_to_arrow(workouts), args.output)
+
+    else:
+        output = sys.stdout if args.output is None \
+            else open(args.output, 'w', encoding='utf-8', newline='')
+
+        try:
+            if args.format == 'csv':
+                workouts_to_csv(workouts, output)
+
+            else:
+                # Depth 3 reaches ride.instructor, and metrics when cached
+                rows = (w.serialize(depth=3, load_all=False)
+                        for w in workouts)
+                if args.format == 'json':
+                    json.dump(list(rows), output)
+                    output.write('\n')
+                else:
+                    for row in rows:
+                        output.write(json.dumps(row) + '\n')
+
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+    timer.phase('write', time.monotonic() - started)
+    return 0
+
+
+def stats(args, timer):
+
+    started = time.monotonic()
+    requests = PelotonAPI.request_count
+
+    if args.remote:
+        # One request for the profile, one for the overview
+        user = PelotonUser.me()
+        overview = user.overview
+        summary = [
+            ('user', user.username),
+            ('total workouts', overview.total_workouts),
+            ('current weekly streak', overview.current_weekly_streak),
+            ('best weekly streak', overview.best_weekly_streak),
+            ('current daily streak', overview.current_daily_streak),
+        ]
+        counts = overview.workout_counts
+
+    else:
+        counts = {}
+        minutes = 0
+        output = 0
+        first = last = None
+        for workout in _cached_workouts(args):
+            discipline = workout.fitness_discipline
+            counts[discipline] = counts.get(discipline, 0) + 1
+
+            if workout.end_time > workout.start_time:
+                minutes += (workout.end_time - workout.start_time) \
+                    .total_seconds() / 60
+
+            first = workout.start_time if first is None \
+                else min(first, workout.start_time)
+            last = workout.start_time if last is None \
+                else max(last, workout.start_time)
+
+            # Only look at metrics we've already cached
+            metrics = object.__getattribute__(workout, 'metrics')
+            output_summary = getattr(metrics, 'output_summary', None)
+            if output_summary is not None and \
+                    output_summary.value is not None:
+                output += output_summary.value
+
+        summary = [
+            ('total workouts', sum(counts.values())),
+            ('total minutes', round(minutes)),
+            ('total output (kj)', round(output)),
+            ('first workout', first.date().isoformat() if first else None),
+            ('last workout', last.date().isoformat() if last else None),
+        ]
+
+    for name, value in summary:
+        print("{:<22} {}".format(name, value))
+
+    for discipline, count in sorted(
+            counts.items(), key=lambda c: (-(c[1] or 0), str(c[0]))):
+        print("  {:<20} {}".format(discipline, count))
+
+    timer.phase('stats', time.monotonic() - started,
+                PelotonAPI.request_count - requests)
+    return 0
+
+
+def _build_parser():
+
+    parser = argparse.ArgumentParser(
+        prog='peloton', description='Sync and export Peloton workout data')
+    parser.add_argument(
+        '--cache-dir', default=_default_cache_dir(),
+        help='where synced data lives (default: $PELOTON_CACHE or '
+             '~/.cache/peloton)')
+    parser.add_argument(
+        '--since', type=_parse_date,
+        help='only include workouts started on or after this date')
+    parser.add_argument(
+        '--until', type=_parse_date,
+        help='only include workouts started on or before this date')
+    parser.add_argument(
+        '-q', '--quiet', action='store_true',
+        help="don't print progress or timings")
+
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    sync_parser = subparsers.add_parser(
+        'sync', help='fetch new workouts, resuming any interrupted sync')
+    sync_parser.set_defaults(func=sync)
+    sync_parser.add_argument(
+        '-j', '--jobs', type=int, default=4,
+        help='number of concurrent workers (default: 4)')
+    sync_parser.add_argument(
+        '--processes', action='store_true',
+        help='use worker processes instead of threads')
+    sync_parser.add_argument(
+        '--every-n', type=int, default=1,
+        help='metric resolution, in seconds (default: 1). Each '
+             'resolution is cached separately')
+    sync_parser.add_argument(
+        '--page-size', type=int, default=10,
+        help='workouts per page request (default: 10)')
+    sync_parser.add_argument(
+        '--shard-size', type=int, default=25,
+        help='workouts per metrics shard (default: 25)')
+    sync_parser.add_argument(
+        '--no-metrics', action='store_true',
+        help="don't fetch per-workout metrics")
+
+    export_parser = subparsers.add_parser(
+        'export', help='write cached workouts out')
+    export_parser.set_defaults(func=export)
+    export_parser.add_argument(
+        '-f', '--format', choices=_FORMATS, default='json',
+        help='output format (default: json)')
+    export_parser.add_argument(
+        '-o', '--output',
+        help='file to write to (default: stdout)')
+    export_parser.add_argument(
+        '--every-n', type=int,
+        help='metric resolution to export, in seconds (default: the '
+             'finest synced)')
+
+    stats_parser = subparsers.add_parser(
+        'stats', help='summarise workouts')
+    stats_parser.set_defaults(func=stats)
+    stats_parser.add_argument(
+        '--remote', action='store_true',
+        help='summarise the account via the API instead of the cache '
+             '(ignores --since/--until)')
+
+    return parser
+
+
+def main(argv=None):
+
+    args = _build_parser().parse_args(argv)
+    timer = _Timer()
+
+    try:
+        status = args.func(args, timer)
+    except PelotonException as e:
+        print("peloton: {}".format(getattr(e, 'message', e)),
+              file=sys.stderr)
+        status = 2
+
+    if not args.quiet and timer.phases:
+        timer.report()
+
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,232 @@
+#! /usr/bin/env python3.6
+# -*- coding: latin-1 -*-
+
+""" Converters from Peloton objects to pandas DataFrames, Arrow Tables
+    and CSV
+
+Columns are built straight from object attributes with proper types
+(UTC timestamps, numeric metrics, categorical disciplines/instructors)
+rather than round tripping every row through PelotonObject.serialize()
+
+pandas and pyarrow are both optional, install whichever you need. They
+are only imported when a conversion asks for them. CSV output needs
+neither
+"""
+
+import csv
+
+from datetime import datetime
+from datetime import timezone
+
+from .peloton import NotLoaded
+from .peloton import PelotonException
+
+
+# Column kinds that each backend knows how to build
+_TIMESTAMP = 'timestamp'
+_CATEGORY = 'category'
+_STRING = 'string'
+_INT = 'int'
+_FLOAT = 'float'
+
+
+def _raw(obj, attr):
+    """ Fetch an attribute without triggering any lazy loading, mapping
+        NotLoaded (and missing attributes) to None
+    """
+    try:
+        value = object.__getattribute__(obj, attr)
+    except AttributeError:
+        return None
+
+    return None if isinstance(value, NotLoaded) else value
+
+
+def _epoch(value):
+    """ Seconds since the epoch, or None for a missing timestamp (which
+        PelotonWorkout records as the epoch itself)
+    """
+    if value is None:
+        return None
+
+    return int(value.timestamp()) or None
+
+
+def _workout_columns(workouts):
+    """ Returns a list of (name, kind, values) column tuples describing
+        `workouts`
+    """
+
+    workouts = list(workouts)
+    rides = [_raw(w, 'ride') for w in workouts]
+    instructors = [_raw(r, 'instructor') if r is not None else None
+                   for r in rides]
+
+    def ride_attr(attr):
+        return [getattr(r, attr, None) if r is not None else None
+                for r in rides]
+
+    return [
+        ('id', _STRING, [_raw(w, 'id') for w in workouts]),
+        ('created', _TIMESTAMP,
+            [_epoch(_raw(w, 'created')) for w in workouts]),
+        ('created_at', _TIMESTAMP,
+            [_epoch(_raw(w, 'created_at')) for w in workouts]),
+        ('start_time', _TIMESTAMP,
+            [_epoch(_raw(w, 'start_time')) for w in workouts]),
+        ('end_time', _TIMESTAMP,
+            [_epoch(_raw(w, 'end_time')) for w in workouts]),
+        ('fitness_discipline', _CATEGORY,
+            [_raw(w, 'fitness_discipline') for w in workouts]),
+        ('status', _CATEGORY, [_raw(w, 'status') for w in workouts]),
+        ('metrics_type', _CATEGORY,
+            [_raw(w, 'metrics_type') for w in workouts]),
+        ('ride_id', _STRING, ride_attr('id')),
+        ('ride_title', _STRING, ride_attr('title')),
+        ('ride_duration', _INT, ride_attr('duration')),
+        ('instructor', _CATEGORY,
+            [i.name if i is not None else None for i in instructors]),
+        ('leaderboard_rank', _INT,
+            [_raw(w, 'leaderboard_rank') for w in workouts]),
+        ('leaderboard_users', _INT,
+            [_raw(w, 'leaderboard_users') for w in workouts]),
+    ]
+
+
+def _metrics_columns(metrics):
+    """ Returns a list of (name, kind, values) column tuples describing
+        `metrics`, one row per sample
+    """
+
+    seconds = metrics.seconds_since_pedaling_start
+    columns = [('seconds', _INT, seconds)]
+
+    for slug in ['output', 'cadence', 'resistance', 'speed', 'heart_rate']:
+        metric = getattr(metrics, slug, None)
+        if metric is None or metric.values is None:
+            continue
+
+        # Pad (or trim) so every column lines up with our offsets
+        values = list(metric.values[:len(seconds)])
+        values += [None] * (len(seconds) - len(values))
+        columns.append((slug, _FLOAT, values))
+
+    segments = [None] * len(seconds)
+    for segment in metrics.segments:
+        for i in range(segment.start_index, segment.end_index):
+            segments[i] = segment.name
+    columns.append(('segment', _CATEGORY, segments))
+
+    return columns
+
+
+def _to_dataframe(columns):
+
+    try:
+        import pandas
+    except ImportError:
+        raise PelotonException(
+            "pandas is required for DataFrame conversion, "
+            "install it with `pip install pandas`")
+
+    data = {}
+    for name, kind, values in columns:
+        if kind == _TIMESTAMP:
+            data[name] = pandas.to_datetime(
+                pandas.Series(values, dtype='float64'), unit='s', utc=True
+            ).astype('datetime64[ns, UTC]')
+        elif kind == _CATEGORY:
+            data[name] = pandas.Series(values, dtype='category')
+        elif kind == _INT:
+            data[name] = pandas.Series(values, dtype='Int64')
+        elif kind == _FLOAT:
+            data[name] = pandas.Series(values, dtype='float64')
+        else:
+            data[name] = pandas.Series(values, dtype='object')
+
+    return pandas.DataFrame(data)
+
+
+def _to_csv(columns, output):
+
+    writer = csv.writer(output)
+    writer.writerow([name for name, _, _ in columns])
+
+    values = []
+    for _, kind, column in columns:
+        if kind == _TIMESTAMP:
+            column = [datetime.fromtimestamp(v, timezone.utc).isoformat()
+                      if v is not None else None for v in column]
+        values.append(column)
+
+    writer.writerows(zip(*values))
+
+
+def _to_arrow(columns):
+
+    try:
+        import pyarrow
+    except ImportError:
+        raise PelotonException(
+            "pyarrow is required for Arrow conversion, "
+            "install it with `pip install pyarrow`")
+
+    arrays = []
+    names = []
+    for name, kind, values in columns:
+        if kind == _TIMESTAMP:
+            array = pyarrow.array(values, type=pyarrow.timestamp('s', 'UTC'))
+        elif kind == _CATEGORY:
+            array = pyarrow.array(
+                values, type=pyarrow.string()).dictionary_encode()
+        elif kind == _INT:
+            array = pyarrow.array(values, type=pyarrow.int64())
+        elif kind == _FLOAT:
+            array = pyarrow.array(values, type=pyarrow.float64())
+        else:
+            array = pyarrow.array(values, type=pyarrow.string())
+
+        arrays.append(array)
+        names.append(name)
+
+    return pyarrow.Table.from_arrays(arrays, names=names)
+
+
+def workouts_to_dataframe(workouts):
+    """ Build a pandas DataFrame with one row per PelotonWorkout
+
+    Lazy loaded data (eg: leaderboard stats) is not fetched; it shows
+    up as missing unless it was already loaded
+    """
+    return _to_dataframe(_workout_columns(workouts))
+
+
+def workouts_to_arrow(workouts):
+    """ Build a pyarrow Table with one row per PelotonWorkout
+
+    Lazy loaded data (eg: leaderboard stats) is not fetched; it shows
+    up as null unless it was already loaded
+    """
+    return _to_arrow(_workout_columns(workouts))
+
+
+def workouts_to_csv(workouts, output):
+    """ Write one CSV row per PelotonWorkout to the file object `output`,
+        with the same columns as workouts_to_dataframe() and timestamps
+        in ISO 8601 (UTC)
+    """
+    _to_csv(_workout_columns(workouts), output)
+
+
+def metrics_to_dataframe(metrics):
+    """ Build a pandas DataFrame with one row per metric sample of a
+        PelotonWorkoutMetrics instance
+    """
+    return _to_dataframe(_metrics_columns(metrics))
+
+
+def metrics_to_arrow(metrics):
+    """ Build a pyarrow Table with one row per metric sample of a
+        PelotonWorkoutMetrics instance
+    """
+    return _to_arrow(_metrics_columns(metrics))
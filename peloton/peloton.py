@@ -5,7 +5,11 @@ import os
 import requests
 import logging
 import decimal
+import time
+import threading
 
+from bisect import bisect_left
+from itertools import accumulate
 from datetime import datetime
 from datetime import timezone
 from datetime import date
@@ -177,6 +181,8 @@ class PelotonObject:
             raw_value = super(PelotonObject, self).__getattribute__(k)
             if isinstance(raw_value, NotLoaded):
                 dont_load.append(k)
+            else:
+                obj_attrs[k] = raw_value
 
         # We've gone through our pre-flight prep, now lets actually
         # serialize our data
@@ -205,7 +211,10 @@ class PelotonObject:
                     elif isinstance(val, decimal.Decimal):
                         serialized_list.append("%.1f" % val)
 
-                    elif isinstance(val, (str, int, dict)):
+                    # Metric series are floats, with None for gaps, and
+                    # need to keep every sample to stay aligned
+                    elif val is None or \
+                            isinstance(val, (str, int, float, dict)):
                         serialized_list.append(val)
 
                 # Only add if we have data (this _can_ be an empty list
@@ -253,6 +262,11 @@ class PelotonAPI:
     # Hold our user ID (pulled when we authenticate to the API)
     user_id = None
 
+    # Number of API requests made by this process, handy for tuning
+    # bulk pulls
+    request_count = 0
+    _request_count_lock = threading.Lock()
+
     # Headers we'll be using for each request
     headers = {
         "Content-Type": "application/json",
@@ -260,10 +274,15 @@ class PelotonAPI:
     }
 
     @classmethod
-    def _api_request(cls, uri, params={}):
+    def _api_request(cls, uri, params={}, headers=None):
         """ Base function that everything will use under the hood to
             interact with the API
 
+        Args:
+            uri: path of the endpoint to request
+            params: query string parameters
+            headers: additional headers to send along with our defaults
+
         Returns a requests response instance, or raises an exception on error
         """
 
@@ -271,9 +290,16 @@ class PelotonAPI:
         if cls.peloton_session is None:
             cls._create_api_session()
 
+        with PelotonAPI._request_count_lock:
+            PelotonAPI.request_count += 1
+
         get_logger().debug("Request {} [{}]".format(_BASE_URL + uri, params))
+        request_headers = dict(cls.headers)
+        if headers is not None:
+            request_headers.update(headers)
+
         resp = cls.peloton_session.get(
-            _BASE_URL + uri, headers=cls.headers, params=params)
+            _BASE_URL + uri, headers=request_headers, params=params)
         get_logger().debug("Response {}: [{}]".format(
             resp.status_code, resp._content))
 
@@ -337,18 +363,113 @@ class PelotonUser(PelotonObject):
     """ Read-Only class that describes a Peloton User
 
     This class should never be invoked directly
-
-    TODO: Flesh this out
     """
 
     def __init__(self, **kwargs):
+        """ This class is instantiated by
+        PelotonUser.me()
+        PelotonUser.get()
+        """
 
         self.username = kwargs.get('username')
         self.id = kwargs.get('id')
 
+        # These are only returned for the authenticated user (/api/me)
+        self.first_name = kwargs.get('first_name')
+        self.last_name = kwargs.get('last_name')
+        self.email = kwargs.get('email')
+
+        self.location = kwargs.get('location')
+        self.image_url = kwargs.get('image_url')
+        self.is_private = kwargs.get('is_profile_private')
+
+        self.created_at = datetime.fromtimestamp(
+            kwargs.get('created_at', 0) or 0, timezone.utc)
+
+        # Lifetime totals
+        self.total_workouts = kwargs.get('total_workouts')
+        self.total_pedaling_metric_workouts = kwargs.get(
+            'total_pedaling_metric_workouts')
+        self.total_non_pedaling_metric_workouts = kwargs.get(
+            'total_non_pedaling_metric_workouts')
+        self.total_followers = kwargs.get('total_followers')
+        self.total_following = kwargs.get('total_following')
+
+        # Number of workouts per fitness discipline, keyed by slug
+        self.workout_counts = {}
+        for count in kwargs.get('workout_counts') or []:
+            self.workout_counts[count.get('slug')] = count.get('count')
+
+        # Streaks, personal records, etc come from a separate endpoint
+        self.overview = kwargs.get('overview', NotLoaded())
+
     def __str__(self):
         return self.username
 
+    def __getattribute__(self, attr):
+
+        value = object.__getattribute__(self, attr)
+
+        # Overview gets loaded from its own endpoint, on request
+        if attr == 'overview' and type(value) is NotLoaded:
+            self.overview = PelotonUserFactory.overview(self.id)
+            return self.overview
+
+        return value
+
+    @classmethod
+    def me(cls):
+        """ Get the currently authenticated user
+        """
+        return PelotonUserFactory.me()
+
+    @classmethod
+    def get(cls, user_id):
+        """ Get a specific user
+        """
+        return PelotonUserFactory.get(user_id)
+
+
+class PelotonUserOverview(PelotonObject):
+    """ Read-Only class that describes the aggregate stats of a user
+        (workout counts, streaks, personal records)
+
+    This class should never be invoked directly
+    """
+
+    def __init__(self, **kwargs):
+
+        self.user_id = kwargs.get('id')
+
+        # Number of workouts per fitness discipline, keyed by slug
+        workout_counts = kwargs.get('workout_counts') or {}
+        self.total_workouts = workout_counts.get('total_workouts')
+        self.workout_counts = {}
+        for count in workout_counts.get('workouts') or []:
+            self.workout_counts[count.get('slug')] = count.get('count')
+
+        # Weekly and daily streaks
+        streaks = kwargs.get('streaks') or {}
+        self.current_weekly_streak = streaks.get('current_weekly')
+        self.best_weekly_streak = streaks.get('best_weekly')
+        self.current_daily_streak = streaks.get('current_daily')
+
+        # Personal records, grouped by discipline. These come back in a
+        # few different shapes depending on the discipline, so we keep
+        # them as-is
+        self.personal_records = kwargs.get('personal_records') or []
+
+        # Count of each achievement earned over the user's lifetime
+        self.achievement_counts = {}
+        achievements = kwargs.get('achievement_counts') or {}
+        for achievement in achievements.get('achievements') or []:
+            template = achievement.get('template') or {}
+            self.achievement_counts[template.get('slug')] = \
+                achievement.get('count')
+
+    def __str__(self):
+        return str(self.user_id)
+
 
 class PelotonWorkout(PelotonObject):
     """ A read-only class that defines a workout instance/object
@@ -536,6 +657,13 @@ class PelotonWorkoutMetrics(PelotonObject):
         self.fitness_discipline = kwargs.get('segment_list')[0]['metrics_type'] if len(
             kwargs.get('segment_list')) else ''
 
+        # Seconds (since the workout started) at which each metric sample
+        # was taken. Older responses don't include this, so fall back to
+        # assuming evenly spaced samples
+        self.every_n = kwargs.get('every_n', 1)
+        self.seconds_since_pedaling_start = kwargs.get(
+            'seconds_since_pedaling_start')
+
         # Build summary attributes
         metric_summaries = ['total_output', 'distance', 'calories']
         for metric in kwargs.get('summaries'):
@@ -562,9 +690,110 @@ class PelotonWorkoutMetrics(PelotonObject):
 
             setattr(self, metric['slug'], PelotonMetric(**metric))
 
+        if self.seconds_since_pedaling_start is None:
+            samples = max([len(m.get('values') or [])
+                           for m in kwargs.get('metrics')] or [0])
+            self.seconds_since_pedaling_start = list(
+                range(0, samples * self.every_n, self.every_n))
+
+        # Build our segments, and work out which range of metric samples
+        # each of them covers so that per-segment stats are just slices
+        offsets = self.seconds_since_pedaling_start
+        self.segments = []
+        for segment in kwargs.get('segment_list'):
+            segment = PelotonWorkoutSegment(**segment)
+            segment.start_index = bisect_left(
+                offsets, segment.start_time_offset)
+            segment.end_index = bisect_left(
+                offsets, segment.end_time_offset)
+            self.segments.append(segment)
+
+        # Running totals (and sample counts, since some metrics may have
+        # gaps) per metric, so any segment average is a constant time
+        # lookup instead of a rescan of the whole series
+        self._prefix_sums = {}
+        for slug in metric_categories:
+            metric = getattr(self, slug, None)
+            if metric is None or not metric.values:
+                continue
+
+            values = metric.values
+            self._prefix_sums[slug] = (
+                [0] + list(accumulate(v or 0 for v in values)),
+                [0] + list(accumulate(int(v is not None) for v in values)))
+
     def __str__(self):
         return self.fitness_discipline
 
+    def segment_values(self, segment, slug='output'):
+        """ Return the samples of metric `slug` that fall within `segment`
+        """
+        metric = getattr(self, slug, None)
+        if metric is None or not metric.values:
+            return []
+
+        return segment.slice(metric.values)
+
+    def segment_average(self, segment, slug='output'):
+        """ Return the average of metric `slug` over `segment`, or None
+            if we have no samples for it
+        """
+        if slug not in self._prefix_sums:
+            return None
+
+        sums, counts = self._prefix_sums[slug]
+        count = counts[segment.end_index] - counts[segment.start_index]
+        if not count:
+            return None
+
+        return (sums[segment.end_index] - sums[segment.start_index]) / count
+
+    def segment_stats(self, slug='output'):
+        """ Return a list of (segment, average, max) tuples for metric
+            `slug`, one per segment of this workout
+        """
+        ret = []
+        for segment in self.segments:
+            values = [v for v in self.segment_values(segment, slug)
+                      if v is not None]
+            ret.append((segment, self.segment_average(segment, slug),
+                        max(values) if values else None))
+
+        return ret
+
+    def to_dataframe(self):
+        """ Return these metrics as a pandas DataFrame (requires pandas)
+        """
+        from .dataframe import metrics_to_dataframe
+        return metrics_to_dataframe(self)
+
+    def to_arrow(self):
+        """ Return these metrics as a pyarrow Table (requires pyarrow)
+        """
+        from .dataframe import metrics_to_arrow
+        return metrics_to_arrow(self)
+
+    @classmethod
+    def best_segment(cls, metrics_list, icon_slug, slug='output'):
+        """ Find the segment of type `icon_slug` (eg: "climb") with the
+            highest average `slug` across many workouts, in one pass
+
+        Returns a (metrics, segment, average) tuple, or None if no
+        matching segment was found
+        """
+        best = None
+        for metrics in metrics_list:
+            for segment in metrics.segments:
+                if segment.icon_slug != icon_slug:
+                    continue
+
+                average = metrics.segment_average(segment, slug)
+                if average is not None and \
+                        (best is None or average > best[2]):
+                    best = (metrics, segment, average)
+
+        return best
+
 
 class PelotonInstructor(PelotonObject):
     """ A read-only class that outlines instructor details
@@ -588,12 +817,41 @@ class PelotonInstructor(PelotonObject):
 
 
 class PelotonWorkoutSegment(PelotonObject):
-    """ A read-only class that outlines instructor details
+    """ A read-only class that outlines a single segment (warmup, climb,
+        cool down, etc) of a workout
 
         This class should never be invoked directly"""
 
-    def __init__(self):
-        raise NotImplementedError()
+    def __init__(self, **kwargs):
+
+        self.id = kwargs.get('id')
+        self.name = kwargs.get('name')
+        self.icon_slug = kwargs.get('icon_slug')
+        self.metrics_type = kwargs.get('metrics_type')
+        self.intensity = kwargs.get('intensity_in_mets')
+
+        # Offsets are in seconds, relative to the start of the workout
+        self.start_time_offset = kwargs.get('start_time_offset', 0)
+        self.length = kwargs.get('length', 0)
+
+        # Positions within the metric series that this segment covers,
+        # as a half-open [start_index, end_index) range. These are set
+        # by PelotonWorkoutMetrics once it knows the sample offsets
+        self.start_index = 0
+        self.end_index = 0
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def end_time_offset(self):
+        return self.start_time_offset + self.length
+
+    def slice(self, values):
+        """ Return the portion of `values` (a metric series) that falls
+            within this segment
+        """
+        return values[self.start_index:self.end_index]
 
 
 class PelotonWorkoutAchievement(PelotonObject):
@@ -622,6 +880,25 @@ class PelotonWorkoutFactory(PelotonAPI):
             each workout
         """
 
+        # Get our first page, which includes number of successive pages
+        res = cls._list_page(0, results_per_page)
+
+        # Add this pages data to our return list
+        ret = [PelotonWorkout(**workout) for workout in res['data']]
+
+        # We've got page 0, so start with page 1
+        for page in range(1, res['page_count']):
+
+            res = cls._list_page(page, results_per_page)
+            [ret.append(PelotonWorkout(**workout)) for workout in res['data']]
+
+        return ret
+
+    @classmethod
+    def _list_page(cls, page, results_per_page=10):
+        """ Return the raw json response for a single page of workouts
+        """
+
         # We need a user ID to list all workouts. @pelotoncycle, please
         # don't do this :(
         if cls.user_id is None:
@@ -629,25 +906,12 @@ class PelotonWorkoutFactory(PelotonAPI):
 
         uri = '/api/user/{}/workouts'.format(cls.user_id)
         params = {
-            'page': 0,
+            'page': page,
             'limit': results_per_page,
             'joins': 'ride,ride.instructor'
         }
 
-        # Get our first page, which includes number of successive pages
-        res = cls._api_request(uri, params).json()
-
-        # Add this pages data to our return list
-        ret = [PelotonWorkout(**workout) for workout in res['data']]
-
-        # We've got page 0, so start with page 1
-        for i in range(1, res['page_count']):
-
-            params['page'] += 1
-            res = cls._api_request(uri, params).json()
-            [ret.append(PelotonWorkout(**workout)) for workout in res['data']]
-
-        return ret
+        return cls._api_request(uri, params).json()
 
     @classmethod
     def get(cls, workout_id):
@@ -684,19 +948,101 @@ class PelotonWorkoutFactory(PelotonAPI):
         return PelotonWorkout(**res['data'][0])
 
 
+class PelotonUserFactory(PelotonAPI):
+    """ Class that handles fetching data and instantiating objects
+
+    These endpoints return aggregates that change slowly, so responses
+    are cached for `cache_ttl` seconds to keep dashboards cheap
+
+    See PelotonUser for details
+    """
+
+    # How long (in seconds) to hold on to responses
+    cache_ttl = 300
+
+    # Maps a uri to an (expiry time, json response) tuple
+    _cache = {}
+
+    @classmethod
+    def _cached_request(cls, uri, params={}, headers=None):
+        """ Return the json response for `uri`, hitting the API only if
+            we don't hold an unexpired copy of it
+        """
+
+        now = time.monotonic()
+        cached = cls._cache.get(uri)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+
+        # Drop anything that has expired (including this uri), so asking
+        # after many different users doesn't grow the cache forever
+        for key in [k for k, v in cls._cache.items() if v[0] <= now]:
+            del cls._cache[key]
+
+        res = cls._api_request(uri, params, headers).json()
+        cls._cache[uri] = (now + cls.cache_ttl, res)
+        return res
+
+    @classmethod
+    def clear_cache(cls):
+        """ Drop all cached responses
+        """
+        cls._cache.clear()
+
+    @classmethod
+    def me(cls):
+        """ Returns an instance of PelotonUser that represents the
+            authenticated user
+        """
+        return PelotonUser(**cls._cached_request('/api/me'))
+
+    @classmethod
+    def get(cls, user_id):
+        """ Get user details by user_id
+        """
+
+        uri = '/api/user/{}'.format(user_id)
+        return PelotonUser(**cls._cached_request(uri))
+
+    @classmethod
+    def overview(cls, user_id=None):
+        """ Returns an instance of PelotonUserOverview for user_id
+            (defaults to the authenticated user)
+        """
+
+        if user_id is None:
+            if cls.user_id is None:
+                cls._create_api_session()
+            user_id = cls.user_id
+
+        # This endpoint refuses to answer without the platform header
+        uri = '/api/user/{}/overview'.format(user_id)
+        res = cls._cached_request(
+            uri, {'version': 1}, {'peloton-platform': 'web'})
+        return PelotonUserOverview(**res)
+
+
 class PelotonWorkoutMetricsFactory(PelotonAPI):
     """ Class to handle fetching and transformation of metric data
     """
 
     @classmethod
-    def get(cls, workout_id):
+    def get(cls, workout_id, every_n=1):
         """ Returns a list of PelotonMetric instances for each metric type
         """
+        return PelotonWorkoutMetrics(**cls._get_raw(workout_id, every_n))
+
+    @classmethod
+    def _get_raw(cls, workout_id, every_n=1):
+        """ Return the raw json performance graph for a workout, sampled
+            every `every_n` seconds
+        """
 
         uri = '/api/workout/{}/performance_graph'.format(workout_id)
         params = {
-            'every_n': 1
+            'every_n': every_n
         }
 
         res = cls._api_request(uri, params).json()
-        return PelotonWorkoutMetrics(**res)
+        res.setdefault('every_n', every_n)
+        return res
@@ -24,6 +24,15 @@ setuptools.setup(
         "Natural Language :: English",
     ],
     python_requires='>=3.6',
+    entry_points={
+        'console_scripts': [
+            'peloton = peloton.cli:main',
+        ],
+    },
+    extras_require={
+        'pandas': ['pandas'],
+        'arrow': ['pyarrow'],
+    },
     package_data={
     },
     exclude_package_data={},
@@ -0,0 +1,98 @@
+import re
+import time
+from collections import Counter
+
+import pytest
+
+from peloton.peloton import PelotonAPI
+from peloton.peloton import PelotonWorkoutFactory
+from peloton.peloton import PelotonWorkoutMetricsFactory
+
+
+class FakeResponse:
+
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
+class FakeAPI:
+    """ Serves a user's workout list (newest first) and performance
+        graphs, recording every request made
+    """
+
+    def __init__(self, count):
+        self.workouts = []
+        self.add(count)
+
+        self.calls = []
+        self.fail_pages = set()
+        self.fail_metrics = set()
+        self.delays = {}
+
+    def add(self, count):
+        """ Log `count` new workouts, which go to the top of the list
+        """
+        first = len(self.workouts)
+        new = [{'id': 'w{:03d}'.format(i), 'start_time': 1600000000 + i,
+                'fitness_discipline': 'cycling'}
+               for i in range(first, first + count)]
+        self.workouts[:0] = reversed(new)
+
+    @property
+    def ids(self):
+        return [w['id'] for w in self.workouts]
+
+    def metrics_calls(self):
+        return Counter(arg for kind, arg in self.calls if kind == 'metrics')
+
+    def request(self, uri, params={}, headers=None):
+
+        if uri.endswith('/workouts'):
+            page, limit = params['page'], params['limit']
+            self.calls.append(('page', page))
+            if page in self.fail_pages:
+                raise RuntimeError("page {} failed".format(page))
+
+            return FakeResponse({
+                'data': self.workouts[page * limit:(page + 1) * limit],
+                'total': len(self.workouts),
+                'page_count': -(-len(self.workouts) // limit),
+            })
+
+        workout_id = re.match(r'/api/workout/(\w+)/', uri).group(1)
+        self.calls.append(('metrics', workout_id))
+        time.sleep(self.delays.get(workout_id, 0))
+        if workout_id in self.fail_metrics:
+            raise RuntimeError("metrics for {} failed".format(workout_id))
+
+        return FakeResponse({
+            'duration': 60,
+            'segment_list': [],
+            'summaries': [],
+            'metrics': [{'slug': 'output', 'values': [1.5, None, 3]}],
+        })
+
+
+@pytest.fixture
+def api(monkeypatch):
+
+    api = FakeAPI(25)
+
+    def _login(cls):
+        cls.user_id = 'user'
+        cls.peloton_session = object()
+
+    monkeypatch.setattr(PelotonAPI, '_api_request', classmethod(
+        lambda cls, uri, params={}, headers=None: api.request(uri, params)))
+    monkeypatch.setattr(PelotonAPI, '_create_api_session',
+                        classmethod(_login))
+
+    for cls in [PelotonAPI, PelotonWorkoutFactory,
+                PelotonWorkoutMetricsFactory]:
+        monkeypatch.setattr(cls, 'peloton_session', None)
+        monkeypatch.setattr(cls, 'user_id', None)
+
+    return api
@@ -0,0 +1,171 @@
+import json
+import os
+import time
+import multiprocessing
+
+import pytest
+
+from peloton import backfill
+from peloton.backfill import BackfillJob
+from peloton.peloton import PelotonWorkoutFactory
+
+
+def _job(path, **kwargs):
+    kwargs.setdefault('shard_size', 4)
+    kwargs.setdefault('workers', 3)
+    return BackfillJob(str(path), **kwargs)
+
+
+def _checkpoint(path):
+    with open(os.path.join(str(path), 'checkpoint.json')) as f:
+        return json.load(f)
+
+
+def test_backfill_fetches_everything(api, tmp_path):
+
+    job = _job(tmp_path)
+    assert job.run()
+
+    workouts = list(job.workouts())
+    assert [w.id for w in workouts] == api.ids
+    assert all(w.metrics.output.values == [1.5, None, 3] for w in workouts)
+    assert job.requests_made == len(api.calls)
+
+
+def test_resume_after_crash_mid_metrics(api, tmp_path):
+
+    api.fail_metrics.add('w010')
+    with pytest.raises(RuntimeError):
+        _job(tmp_path, shard_size=1).run()
+
+    api.fail_metrics.clear()
+    job = _job(tmp_path, shard_size=1)
+    assert job.run()
+
+    # Only the shard that failed gets fetched twice
+    calls = api.metrics_calls()
+    assert set(calls) == set(api.ids)
+    assert calls.pop('w010') == 2
+    assert set(calls.values()) == {1}
+    assert [w.id for w in job.workouts()] == api.ids
+
+
+def test_resume_after_crash_mid_pages_with_new_workouts(api, tmp_path):
+
+    api.add(10)
+    api.fail_pages.add(2)
+    with pytest.raises(RuntimeError):
+        _job(tmp_path, workers=1).run()
+
+    # Workouts logged before we resume push the oldest ones past the
+    # page count we saw the first time around
+    api.fail_pages.clear()
+    api.add(5)
+
+    job = _job(tmp_path)
+    assert job.run()
+    assert [w['id'] for w in job._raw_workouts()] == api.ids
+    assert set(api.metrics_calls()) == set(api.ids)
+
+
+def test_stop_then_resume(api, tmp_path):
+
+    job = _job(tmp_path, shard_size=1, workers=1)
+    job.progress = lambda progress: \
+        progress.phase == 'metrics' and job.stop()
+    assert not job.run()
+
+    checkpoint = _checkpoint(tmp_path)
+    assert len(checkpoint['metrics_done']['1']) == 1
+
+    job = _job(tmp_path, shard_size=1)
+    assert job.run()
+    assert set(api.metrics_calls().values()) == {1}
+    assert len(api.metrics_calls()) == len(api.ids)
+
+
+def test_failing_shard_checkpoints_in_flight_shards(api, tmp_path):
+
+    # The newest workout fails straight away, while the next one is
+    # still being fetched by the other worker
+    api.fail_metrics.add(api.ids[0])
+    api.delays[api.ids[1]] = 0.3
+
+    with pytest.raises(RuntimeError):
+        _job(tmp_path, shard_size=1, workers=2).run()
+
+    metrics_done = _checkpoint(tmp_path)['metrics_done']['1']
+    assert api.ids[1] in metrics_done
+    assert api.ids[0] not in metrics_done
+
+
+def test_rerun_picks_up_new_workouts(api, tmp_path):
+
+    assert _job(tmp_path).run()
+    api.calls[:] = []
+
+    api.add(3)
+    job = _job(tmp_path)
+    assert job.run()
+
+    assert [w.id for w in job.workouts()] == api.ids
+    assert set(api.metrics_calls()) == set(api.ids[:3])
+
+    # Page 0 holds all the new workouts, so that's the only page we need
+    assert [arg for kind, arg in api.calls if kind == 'page'] == [0]
+
+
+def test_changing_resolution_keeps_both(api, tmp_path):
+
+    assert _job(tmp_path, every_n=1).run()
+    assert _job(tmp_path, every_n=5).run()
+
+    assert len(api.metrics_calls()) == len(api.ids)
+    assert set(api.metrics_calls().values()) == {2}
+    for every_n in ['1', '5']:
+        assert len(os.listdir(os.path.join(
+            str(tmp_path), 'metrics', every_n))) == len(api.ids)
+
+
+def test_worker_process_drops_inherited_session(api, monkeypatch):
+
+    PelotonWorkoutFactory.peloton_session = 'parent session'
+    PelotonWorkoutFactory.user_id = 'user'
+
+    # Pretend we've been forked
+    monkeypatch.setattr(backfill, '_session_pid', -1)
+    backfill._reset_worker_session()
+
+    assert PelotonWorkoutFactory.peloton_session is None
+    assert PelotonWorkoutFactory.user_id is None
+    assert backfill._session_pid == os.getpid()
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != 'fork',
+                    reason="worker processes need to inherit our fake API")
+def test_backfill_with_processes(api, tmp_path):
+
+    job = _job(tmp_path, use_processes=True, workers=2)
+    assert job.run()
+    assert len([w for w in job.workouts()
+                if w.metrics.output.values]) == len(api.ids)
+
+
+def test_keyboard_interrupt_does_not_wait_for_in_flight_shards(
+        api, tmp_path):
+
+    # The first shard finishes straight away, the rest take a while
+    for workout_id in api.ids[1:]:
+        api.delays[workout_id] = 2
+
+    def _interrupt(progress):
+        if progress.phase == 'metrics':
+            raise KeyboardInterrupt()
+
+    job = _job(tmp_path, shard_size=1, workers=2, progress=_interrupt)
+    started = time.monotonic()
+    with pytest.raises(KeyboardInterrupt):
+        job.run()
+
+    assert time.monotonic() - started < 1
+    assert _checkpoint(tmp_path)['metrics_done']['1'] == [api.ids[0]]
@@ -0,0 +1,156 @@
+import csv
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+
+from peloton.cli import main
+
+
+def _export(tmp_path, *args):
+    output = tmp_path / 'export.json'
+    assert main(['-q', '--cache-dir', str(tmp_path / 'cache'), 'export',
+                 '-o', str(output)] + list(args)) == 0
+    return json.loads(output.read_text())
+
+
+def test_sync_twice_picks_up_new_workouts(api, tmp_path):
+
+    cache = str(tmp_path / 'cache')
+    assert main(['-q', '--cache-dir', cache, 'sync']) == 0
+    assert len(_export(tmp_path)) == 25
+
+    api.add(3)
+    assert main(['-q', '--cache-dir', cache, 'sync']) == 0
+    assert [w['id'] for w in _export(tmp_path)] == api.ids
+
+
+def test_sync_at_another_resolution(api, tmp_path):
+
+    cache = str(tmp_path / 'cache')
+    assert main(['-q', '--cache-dir', cache, 'sync']) == 0
+    assert main(['-q', '--cache-dir', cache, 'sync', '--every-n', '5']) == 0
+
+    workouts = _export(tmp_path, '--every-n', '5')
+    assert all(w['metrics']['every_n'] == 5 for w in workouts)
+
+
+def test_export_leaves_the_cache_alone(api, tmp_path):
+
+    cache = tmp_path / 'cache'
+    assert main(['-q', '--cache-dir', str(cache), 'sync',
+                 '--every-n', '5']) == 0
+    before = sorted(str(p) for p in cache.rglob('*'))
+
+    _export(tmp_path)
+    _export(tmp_path, '--every-n', '1')
+    assert main(['-q', '--cache-dir', str(cache), 'stats']) == 0
+    assert sorted(str(p) for p in cache.rglob('*')) == before
+
+
+def test_export_keeps_every_metric_sample(api, tmp_path):
+
+    assert main(['-q', '--cache-dir', str(tmp_path / 'cache'), 'sync']) == 0
+
+    for fmt in ['json', 'ndjson']:
+        output = tmp_path / 'export'
+        assert main(['-q', '--cache-dir', str(tmp_path / 'cache'), 'export',
+                     '-f', fmt, '-o', str(output)]) == 0
+
+        lines = output.read_text().splitlines()
+        workout = json.loads(lines[0])[0] if fmt == 'json' \
+            else json.loads(lines[0])
+        assert workout['metrics']['output']['values'] == [1.5, None, 3]
+
+
+# Runs `peloton sync` against a fake API whose metrics requests hang, and
+# touches `started` once the first one is in flight
+_SLOW_SYNC = """
+import os, sys, time
+from peloton.peloton import PelotonAPI
+from peloton.cli import main
+
+class Response:
+    def __init__(self, data):
+        self.data = data
+    def json(self):
+        return self.data
+
+def request(cls, uri, params={}, headers=None):
+    if uri.endswith('/workouts'):
+        return Response({'total': 1, 'data': [{'id': 'w0'}]})
+    open(sys.argv[2], 'w').close()
+    time.sleep(30)
+
+def login(cls):
+    cls.user_id = 'user'
+    cls.peloton_session = object()
+
+PelotonAPI._api_request = classmethod(request)
+PelotonAPI._create_api_session = classmethod(login)
+sys.exit(main(['--cache-dir', sys.argv[1], 'sync'] + sys.argv[3:]))
+"""
+
+
+@pytest.mark.parametrize('sync_args', [[], ['--processes']])
+def test_second_interrupt_aborts_sync(tmp_path, sync_args):
+
+    started = tmp_path / 'started'
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [os.path.dirname(os.path.dirname(os.path.abspath(__file__)))] +
+        sys.path)
+
+    # Not a pipe, which worker processes stuck in their request would
+    # hold open after the parent exits
+    stderr = tmp_path / 'stderr'
+    proc = subprocess.Popen(
+        [sys.executable, '-c', _SLOW_SYNC, str(tmp_path / 'cache'),
+         str(started)] + sync_args,
+        env=env, stderr=stderr.open('w'), start_new_session=True)
+
+    try:
+        deadline = time.monotonic() + 10
+        while not started.exists():
+            assert time.monotonic() < deadline and proc.poll() is None
+            time.sleep(0.05)
+
+        # Like ^C at a terminal, signal the whole process group (which
+        # includes any worker processes)
+        os.killpg(proc.pid, signal.SIGINT)
+        time.sleep(0.2)
+        os.killpg(proc.pid, signal.SIGINT)
+
+        proc.wait(timeout=5)
+
+    finally:
+        # Clean up workers still stuck in their request
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    stderr = stderr.read_text()
+    assert proc.returncode == 130
+    assert "Sync aborted" in stderr
+
+    # Only the parent handled the interrupts
+    assert stderr.count("Stopping after in-flight shards") == 1
+    assert "Traceback" not in stderr
+
+
+def test_export_csv(api, tmp_path):
+
+    assert main(['-q', '--cache-dir', str(tmp_path / 'cache'), 'sync']) == 0
+
+    output = tmp_path / 'export.csv'
+    assert main(['-q', '--cache-dir', str(tmp_path / 'cache'), 'export',
+                 '-f', 'csv', '-o', str(output)]) == 0
+
+    rows = list(csv.DictReader(output.open()))
+    assert [row['id'] for row in rows] == api.ids
+    assert rows[-1]['start_time'] == '2020-09-13T12:26:40+00:00'
@@ -0,0 +1,115 @@
+import pytest
+
+from peloton.peloton import PelotonWorkout
+from peloton.peloton import PelotonWorkoutMetrics
+from peloton.dataframe import workouts_to_arrow
+from peloton.dataframe import workouts_to_dataframe
+from peloton.dataframe import metrics_to_arrow
+from peloton.dataframe import metrics_to_dataframe
+
+
+def _workouts():
+    return [
+        PelotonWorkout(
+            id='finished', created=1600000000, created_at=1600000000,
+            start_time=1600000000, end_time=1600001800,
+            fitness_discipline='cycling', status='COMPLETE',
+            ride={'id': 'ride', 'title': '30 min Ride', 'duration': 1800,
+                  'instructor': {'name': 'Instructor'}}),
+
+        # Still in progress, so no end time (and no ride joined)
+        PelotonWorkout(
+            id='in progress', created=1600100000, created_at=1600100000,
+            start_time=1600100000, end_time=None,
+            fitness_discipline='running', status='IN_PROGRESS'),
+    ]
+
+
+def _metrics():
+    return PelotonWorkoutMetrics(
+        duration=30,
+        seconds_since_pedaling_start=[0, 5, 10, 15, 20, 25],
+        summaries=[],
+        metrics=[
+            {'slug': 'output', 'values': [1.5, None, 3, 4, 5, 6]},
+
+            # Shorter than our offsets
+            {'slug': 'cadence', 'values': [80, 81, 82]},
+        ],
+        segment_list=[
+            {'name': 'Warmup', 'metrics_type': 'cycling',
+             'start_time_offset': 0, 'length': 10},
+            {'name': 'Climb', 'metrics_type': 'cycling',
+             'start_time_offset': 10, 'length': 10},
+        ])
+
+
+def test_workouts_to_dataframe():
+
+    pandas = pytest.importorskip('pandas')
+    df = workouts_to_dataframe(_workouts())
+
+    for column in ['created', 'created_at', 'start_time', 'end_time']:
+        assert str(df[column].dtype) == 'datetime64[ns, UTC]'
+    assert df['start_time'][0] == pandas.Timestamp(1600000000, unit='s',
+                                                   tz='UTC')
+
+    # A missing end time is NaT, not 1970
+    assert pandas.isna(df['end_time'][1])
+
+    for column in ['ride_duration', 'leaderboard_rank']:
+        assert str(df[column].dtype) == 'Int64'
+    assert df['ride_duration'][0] == 1800
+    assert pandas.isna(df['ride_duration'][1])
+
+    for column in ['fitness_discipline', 'status', 'instructor']:
+        assert str(df[column].dtype) == 'category'
+    assert df['instructor'][0] == 'Instructor'
+    assert pandas.isna(df['instructor'][1])
+
+
+def test_workouts_to_arrow():
+
+    pyarrow = pytest.importorskip('pyarrow')
+    table = workouts_to_arrow(_workouts())
+
+    assert table.schema.field('start_time').type == \
+        pyarrow.timestamp('s', 'UTC')
+    assert table.column('end_time').to_pylist()[1] is None
+    assert table.schema.field('ride_duration').type == pyarrow.int64()
+
+    for column in ['fitness_discipline', 'instructor']:
+        assert pyarrow.types.is_dictionary(table.schema.field(column).type)
+    assert table.column('fitness_discipline').to_pylist() == \
+        ['cycling', 'running']
+
+
+def test_metrics_to_dataframe():
+
+    pandas = pytest.importorskip('pandas')
+    df = metrics_to_dataframe(_metrics())
+
+    assert list(df['seconds']) == [0, 5, 10, 15, 20, 25]
+    assert str(df['output'].dtype) == 'float64'
+    assert pandas.isna(df['output'][1])
+
+    # Padded out to line up with our offsets
+    assert list(df['cadence'][:3]) == [80, 81, 82]
+    assert df['cadence'][3:].isna().all()
+
+    assert str(df['segment'].dtype) == 'category'
+    assert list(df['segment'][:4]) == ['Warmup', 'Warmup', 'Climb', 'Climb']
+    assert df['segment'][4:].isna().all()
+
+
+def test_metrics_to_arrow():
+
+    pyarrow = pytest.importorskip('pyarrow')
+    table = metrics_to_arrow(_metrics())
+
+    assert table.schema.field('output').type == pyarrow.float64()
+    assert table.column('cadence').to_pylist() == \
+        [80, 81, 82, None, None, None]
+    assert pyarrow.types.is_dictionary(table.schema.field('segment').type)
+    assert table.column('segment').to_pylist() == \
+        ['Warmup', 'Warmup', 'Climb', 'Climb', None, None]
@@ -0,0 +1,76 @@
+from peloton.peloton import PelotonWorkoutMetrics
+
+
+def _metrics(values, segments, **kwargs):
+    kwargs.setdefault('seconds_since_pedaling_start',
+                      list(range(0, len(values) * 5, 5)))
+    return PelotonWorkoutMetrics(
+        duration=len(values) * 5,
+        summaries=[],
+        metrics=[{'slug': 'output', 'values': values}],
+        segment_list=[dict(metrics_type='cycling', **segment)
+                      for segment in segments],
+        **kwargs)
+
+
+def _segment(name, start, length):
+    return {'name': name, 'icon_slug': name,
+            'start_time_offset': start, 'length': length}
+
+
+def test_segment_boundaries_between_samples():
+
+    # Samples every 5 seconds, segments split at 12 seconds
+    metrics = _metrics([1, 2, 3, 4, 5, 6],
+                       [_segment('warmup', 0, 12), _segment('climb', 12, 18)])
+
+    warmup, climb = metrics.segments
+    assert (warmup.start_index, warmup.end_index) == (0, 3)
+    assert (climb.start_index, climb.end_index) == (3, 6)
+
+    assert metrics.segment_values(warmup) == [1, 2, 3]
+    assert metrics.segment_average(warmup) == 2
+    assert metrics.segment_average(climb) == 5
+
+
+def test_gaps_are_excluded_from_averages():
+
+    metrics = _metrics([None, 4, None, 2, None, None],
+                       [_segment('warmup', 0, 20), _segment('climb', 20, 10)])
+
+    warmup, climb = metrics.segments
+    assert metrics.segment_average(warmup) == 3
+    assert metrics.segment_average(climb) is None
+    assert metrics.segment_stats() == [(warmup, 3, 4), (climb, None, None)]
+
+
+def test_offsets_fall_back_to_every_n():
+
+    metrics = _metrics([1, 2, 3, 4], [_segment('climb', 10, 10)],
+                       seconds_since_pedaling_start=None, every_n=5)
+
+    assert metrics.seconds_since_pedaling_start == [0, 5, 10, 15]
+    assert metrics.segment_values(metrics.segments[0]) == [3, 4]
+
+
+def test_no_segments():
+
+    metrics = _metrics([1, 2, 3], [])
+
+    assert metrics.segments == []
+    assert metrics.fitness_discipline == ''
+    assert metrics.segment_stats() == []
+    assert PelotonWorkoutMetrics.best_segment([metrics], 'climb') is None
+
+
+def test_best_segment_across_workouts():
+
+    first = _metrics([1, 1, 5, 5], [_segment('climb', 10, 10)])
+    second = _metrics([9, 9, 7, 7], [_segment('climb', 10, 10),
+                                     _segment('sprint', 0, 10)])
+
+    metrics, segment, average = PelotonWorkoutMetrics.best_segment(
+        [first, second], 'climb')
+    assert metrics is second
+    assert segment is second.segments[0]
+    assert average == 7
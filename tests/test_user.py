@@ -0,0 +1,108 @@
+import pytest
+
+from peloton.peloton import PelotonAPI
+from peloton.peloton import PelotonUser
+from peloton.peloton import PelotonUserFactory
+
+
+class FakeResponse:
+
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
+@pytest.fixture
+def requests_made(monkeypatch):
+    """ Stub the API, returning the list of (uri, params, headers) requests
+        made
+    """
+
+    requests_made = []
+
+    def _api_request(cls, uri, params={}, headers=None):
+        requests_made.append((uri, params, headers))
+        if uri.endswith('/overview'):
+            return FakeResponse({
+                'id': 'user',
+                'workout_counts': {
+                    'total_workouts': 12,
+                    'workouts': [{'slug': 'cycling', 'count': 10},
+                                 {'slug': 'yoga', 'count': 2}],
+                },
+                'streaks': {'current_weekly': 3, 'best_weekly': 8},
+            })
+
+        return FakeResponse({
+            'id': 'user', 'username': 'rider', 'created_at': 1600000000,
+            'total_workouts': 12,
+            'workout_counts': [{'slug': 'cycling', 'count': 10}],
+        })
+
+    monkeypatch.setattr(PelotonAPI, '_api_request',
+                        classmethod(_api_request))
+    monkeypatch.setattr(PelotonUserFactory, 'user_id', 'user')
+    monkeypatch.setattr(PelotonUserFactory, '_cache', {})
+
+    return requests_made
+
+
+def test_me(requests_made):
+
+    user = PelotonUser.me()
+    assert str(user) == 'rider'
+    assert user.total_workouts == 12
+    assert user.workout_counts == {'cycling': 10}
+    assert user.created_at.year == 2020
+    assert [r[0] for r in requests_made] == ['/api/me']
+
+
+def test_overview_is_lazy_loaded(requests_made):
+
+    user = PelotonUser.get('user')
+    assert [r[0] for r in requests_made] == ['/api/user/user']
+
+    overview = user.overview
+    assert overview.total_workouts == 12
+    assert overview.workout_counts == {'cycling': 10, 'yoga': 2}
+    assert overview.current_weekly_streak == 3
+    assert overview.best_weekly_streak == 8
+
+    uri, params, headers = requests_made[-1]
+    assert uri == '/api/user/user/overview'
+    assert params == {'version': 1}
+    assert headers == {'peloton-platform': 'web'}
+
+    # Only loaded once
+    user.overview
+    assert len(requests_made) == 2
+
+
+def test_responses_are_cached_until_they_expire(requests_made, monkeypatch):
+
+    now = [1000.0]
+    monkeypatch.setattr('peloton.peloton.time.monotonic', lambda: now[0])
+
+    PelotonUser.me()
+    PelotonUser.me()
+    assert len(requests_made) == 1
+
+    now[0] += PelotonUserFactory.cache_ttl
+    PelotonUser.me()
+    assert len(requests_made) == 2
+
+
+def test_expired_responses_are_evicted(requests_made, monkeypatch):
+
+    now = [1000.0]
+    monkeypatch.setattr('peloton.peloton.time.monotonic', lambda: now[0])
+
+    for user_id in range(5):
+        PelotonUser.get(user_id)
+    assert len(PelotonUserFactory._cache) == 5
+
+    now[0] += PelotonUserFactory.cache_ttl
+    PelotonUser.get('someone else')
+    assert list(PelotonUserFactory._cache) == ['/api/user/someone else']